@@ -4,74 +4,144 @@ AI视频生成器 - 自动刷新版本
 保持原有的AWS调用方式，只添加自动刷新功能
 """
 
-import gradio as gr
 import os
 import time
+import asyncio
+import atexit
+import queue
 import logging
-from typing import List, Tuple, Optional
+import logging.handlers
+from functools import cached_property, lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Tuple, Optional
 import sys
+from types import MappingProxyType
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    import gradio as gr
+
 # 加载环境变量
 load_dotenv()
 
-# 设置日志
+# 设置日志：调用方只把记录放入队列，由后台线程负责写文件和终端
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('video_generator_clean.log')
+file_handler.setFormatter(log_formatter)
+stream_handler = logging.StreamHandler(sys.stdout)
+stream_handler.setFormatter(log_formatter)
+
+log_queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(
+    log_queue, file_handler, stream_handler, respect_handler_level=True
+)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# 队列处理器只传递原始消息，格式化统一交给监听线程中的处理器，避免重复格式化
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('video_generator_clean.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+    handlers=[queue_handler]
 )
 
-# 使用原有的后端模块
-from backend.video_generator import VideoGenerator
-
 logger = logging.getLogger(__name__)
 
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# 图片网格固定为 2 行 6 列
+MAX_TILES = 12
+TILES_PER_ROW = 6
+
+# Nova Reel 多镜头视频最多支持 8 张图片
+MAX_SELECTED_IMAGES = 8
+
+# 状态推送的轮询间隔（秒）：状态不变时逐步放慢，状态变化后重置
+STATUS_POLL_INITIAL = 1.0
+STATUS_POLL_BACKOFF = 1.5
+STATUS_POLL_MAX = 10.0
+
+# 状态推送遇到这些状态时结束；in_progress 和 unknown 会继续轮询
+WATCH_FINAL_STATUSES = ("completed", "failed", "error")
+
+
+def current_clock() -> str:
+    """返回本地时间 HH:MM:SS；每次调用都读取本地时间，夏令时切换后依然准确"""
+    now = time.localtime()
+    return f"{now.tm_hour:02d}:{now.tm_min:02d}:{now.tm_sec:02d}"
+
+
+@lru_cache(maxsize=None)
+def load_image_categories(images_dir: str) -> MappingProxyType:
+    """加载图片分类，按目录缓存；热重载或多次创建应用时不再重复遍历"""
+    categories = {}
+    
+    if not os.path.exists(images_dir):
+        logger.error("图片目录不存在: %s", images_dir)
+        return MappingProxyType(categories)
+    
+    # scandir 的 DirEntry 自带类型信息，避免逐个 isdir/stat
+    with os.scandir(images_dir) as category_entries:
+        for category_entry in category_entries:
+            if not category_entry.is_dir(follow_symlinks=False):
+                continue
+            
+            with os.scandir(category_entry.path) as image_entries:
+                images = [
+                    image_entry.path
+                    for image_entry in image_entries
+                    if image_entry.name.lower().endswith(IMAGE_EXTENSIONS)
+                ]
+            
+            if images:
+                categories[category_entry.name] = tuple(sorted(images))
+    
+    logger.info("加载图片分类: %s", list(categories))
+    # 分类在启动后不再变化，使用只读视图避免被意外修改
+    return MappingProxyType(categories)
+
 
 class AutoRefreshVideoApp:
     """自动刷新视频生成应用"""
     
     def __init__(self, images_dir: str = "images"):
         """初始化应用"""
+        # 后端依赖 boto3，延迟到创建应用时再导入，加快启动前的检查
+        from backend.video_generator import VideoGenerator
+        
         self.images_dir = images_dir
         self.video_generator = VideoGenerator()
-        self.image_categories = self._load_image_categories()
-        self.available_styles = self.video_generator.get_flat_style_list()
+        
+        # 每个会话当前有效的状态推送标记，新的推送或关闭自动刷新会使旧推送失效
+        self._watch_tokens: Dict[str, object] = {}
         
         logger.info("自动刷新视频应用初始化完成")
     
-    def _load_image_categories(self) -> dict:
-        """加载图片分类"""
-        categories = {}
-        
-        if not os.path.exists(self.images_dir):
-            logger.error(f"图片目录不存在: {self.images_dir}")
-            return categories
-        
-        for category in os.listdir(self.images_dir):
-            category_path = os.path.join(self.images_dir, category)
-            
-            if os.path.isdir(category_path):
-                images = []
-                for filename in os.listdir(category_path):
-                    if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
-                        image_path = os.path.join(category_path, filename)
-                        images.append(image_path)
-                
-                if images:
-                    categories[category] = sorted(images)
-        
-        logger.info(f"加载图片分类: {list(categories.keys())}")
-        return categories
+    @cached_property
+    def image_categories(self) -> MappingProxyType:
+        """图片分类，首次访问时加载"""
+        return load_image_categories(self.images_dir)
+    
+    @cached_property
+    def available_styles(self) -> list:
+        """可用的视频风格，首次访问时加载"""
+        return list(self.video_generator.get_flat_style_list())
     
-    def get_images_for_category(self, category: str) -> List[str]:
+    def get_images_for_category(self, category: str) -> Tuple[str, ...]:
         """获取分类下的图片"""
-        return self.image_categories.get(category, [])
+        return self.image_categories.get(category, ())
+    
+    def describe_selection(self, selected_indices: List[int]) -> str:
+        """生成选择状态文字，按点击顺序列出已选图片的编号"""
+        if not selected_indices:
+            return "📊 请点击要使用的图片"
+        
+        order = "、".join(str(index + 1) for index in selected_indices)
+        return f"✅ 已选择 {len(selected_indices)}/{MAX_SELECTED_IMAGES} 张: {order}"
     
-    def start_generation(self, category: str, style: str, *checkbox_values) -> Tuple[str, str, str]:
+    async def start_generation(self, category: str, style: str, selected_indices: List[int]) -> Tuple[str, str, str]:
         """启动视频生成"""
         try:
             # 验证输入
@@ -81,22 +151,23 @@ class AutoRefreshVideoApp:
             if not style:
                 return "❌ 请选择视频风格", "", ""
             
+            # 先检查数量，避免无效选择触达后端
+            if not selected_indices:
+                return "❌ 请至少选择一张图片", "", ""
+            
+            if len(selected_indices) > MAX_SELECTED_IMAGES:
+                return f"❌ 最多只能选择{MAX_SELECTED_IMAGES}张图片", "", ""
+            
             # 获取选中的图片
             images = self.get_images_for_category(category)
-            selected_images = []
-            
-            for i, is_selected in enumerate(checkbox_values):
-                if is_selected and i < len(images):
-                    selected_images.append(images[i])
+            selected_images = [images[i] for i in selected_indices if i < len(images)]
             
             if not selected_images:
                 return "❌ 请至少选择一张图片", "", ""
             
-            if len(selected_images) > 8:
-                return "❌ 最多只能选择8张图片", "", ""
-            
-            # 使用原有的视频生成器启动生成
-            result = self.video_generator.start_async_video_generation(
+            # 使用原有的视频生成器启动生成；Bedrock 调用放到线程中，等待期间不占用事件循环
+            result = await asyncio.to_thread(
+                self.video_generator.start_async_video_generation,
                 images=selected_images,
                 style=style,
                 category=category
@@ -120,48 +191,99 @@ class AutoRefreshVideoApp:
             logger.error(error_msg)
             return error_msg, "", str(e)
     
-    def check_status(self, session_id: str) -> Tuple[str, Optional[str], str]:
-        """检查生成状态"""
+    def format_status(self, result: dict) -> Tuple[str, Optional[str], str]:
+        """把后端返回的状态转换为 (状态信息, 视频路径, 错误信息)"""
+        current_time = current_clock()
+        
+        if result["status"] == "completed":
+            return (
+                f"🎉 [{current_time}] 视频生成完成!",
+                result["video_path"],
+                ""
+            )
+        elif result["status"] == "in_progress":
+            return (
+                f"⏳ [{current_time}] {result['message']}",
+                None,
+                ""
+            )
+        elif result["status"] == "failed":
+            return (
+                f"❌ [{current_time}] {result['message']}",
+                None,
+                result['message']
+            )
+        else:
+            return (
+                f"❓ [{current_time}] 状态未知: {result.get('message', '未知状态')}",
+                None,
+                result.get('message', '')
+            )
+    
+    async def watch_status(self, session_id: str) -> AsyncIterator[Tuple[str, Optional[str], str]]:
+        """
+        持续检查生成状态，只在状态变化时产出结果，任务完成、失败或会话不存在时结束
+        
+        轮询间隔从 STATUS_POLL_INITIAL 秒开始，状态不变时按 STATUS_POLL_BACKOFF 倍增长，
+        最长 STATUS_POLL_MAX 秒；状态一旦变化就重置。AWS 调用放到线程中执行，不阻塞事件循环。
+        状态未知（限流、网络波动、视频下载失败）或检查出错时继续轮询，任务仍可能完成。
+        同一会话再次开始推送或调用 stop_watching 后，旧的推送在下次检查时静默结束。
+        """
+        if not session_id:
+            yield "ℹ️ 没有正在进行的生成任务", None, ""
+            return
+        
+        token = object()
+        self._watch_tokens[session_id] = token
+        delay = STATUS_POLL_INITIAL
+        last_state = None
+        
         try:
-            if not session_id:
-                return "ℹ️ 没有正在进行的生成任务", None, ""
-            
-            # 使用原有的状态检查方法
-            result = self.video_generator.check_async_video_status(session_id)
-            current_time = time.strftime('%H:%M:%S')
-            
-            if result["status"] == "completed":
-                return (
-                    f"🎉 [{current_time}] 视频生成完成!",
-                    result["video_path"],
-                    ""
-                )
-            elif result["status"] == "in_progress":
-                return (
-                    f"⏳ [{current_time}] {result['message']}",
-                    None,
-                    ""
-                )
-            elif result["status"] == "failed":
-                return (
-                    f"❌ [{current_time}] {result['message']}",
-                    None,
-                    result['message']
-                )
-            else:
-                return (
-                    f"❓ [{current_time}] 状态未知: {result.get('message', '未知状态')}",
-                    None,
-                    result.get('message', '')
-                )
+            while True:
+                try:
+                    result = await asyncio.to_thread(
+                        self.video_generator.check_async_video_status, session_id
+                    )
+                except Exception as e:
+                    error_msg = f"检查状态失败: {str(e)}"
+                    logger.error(error_msg)
+                    result = None
+                    state = ("check_failed", str(e))
+                    update = (error_msg, None, str(e))
+                else:
+                    state = (result["status"], result.get("message"))
+                    update = None
                 
-        except Exception as e:
-            error_msg = f"检查状态失败: {str(e)}"
-            logger.error(error_msg)
-            return error_msg, None, str(e)
+                if self._watch_tokens.get(session_id) is not token:
+                    return
+                
+                if state != last_state:
+                    last_state = state
+                    delay = STATUS_POLL_INITIAL
+                    yield update or self.format_status(result)
+                else:
+                    delay = min(delay * STATUS_POLL_BACKOFF, STATUS_POLL_MAX)
+                
+                # 完成、失败和会话不存在（error）不会再变化，停止轮询
+                if result is not None and result["status"] in WATCH_FINAL_STATUSES:
+                    return
+                
+                await asyncio.sleep(delay)
+                
+                if self._watch_tokens.get(session_id) is not token:
+                    return
+        finally:
+            if self._watch_tokens.get(session_id) is token:
+                del self._watch_tokens[session_id]
+    
+    def stop_watching(self, session_id: str):
+        """停止该会话的状态推送（关闭自动刷新时调用）"""
+        self._watch_tokens.pop(session_id, None)
     
-    def create_interface(self) -> gr.Blocks:
+    def create_interface(self) -> "gr.Blocks":
         """创建Gradio界面"""
+        # gradio 导入开销较大，只在真正构建界面时导入
+        import gradio as gr
         
         with gr.Blocks(
             title="🎬 AI视频生成器",
@@ -206,7 +328,7 @@ class AutoRefreshVideoApp:
                     # 自动刷新控制
                     # auto_refresh_enabled = True
                     auto_refresh_enabled = gr.Checkbox(
-                        label="🔄 启用自动刷新 (每5秒)",
+                        label="🔄 启用自动刷新 (状态变化时推送)",
                         value=True
                     )
                     
@@ -220,47 +342,19 @@ class AutoRefreshVideoApp:
                         interactive=False
                     )
                     
-                    # 图片网格 - 2行6列
-                    image_components = []
-                    checkbox_components = []
-                    
-                    with gr.Row():
-                        for i in range(6):
-                            with gr.Column(scale=1, min_width=100):
-                                checkbox = gr.Checkbox(
-                                    label="",
-                                    value=False,
-                                    visible=False
-                                )
-                                image = gr.Image(
-                                    label="",
-                                    height=80,
-                                    width=80,
-                                    interactive=False,
-                                    visible=False,
-                                    show_label=False
-                                )
-                                checkbox_components.append(checkbox)
-                                image_components.append(image)
+                    # 图片网格 - 单个图库组件，最多 MAX_TILES 张，每行 TILES_PER_ROW 张
+                    image_gallery = gr.Gallery(
+                        label="图片",
+                        show_label=False,
+                        columns=TILES_PER_ROW,
+                        rows=MAX_TILES // TILES_PER_ROW,
+                        height=240,
+                        allow_preview=False,
+                        object_fit="cover"
+                    )
                     
-                    with gr.Row():
-                        for i in range(6, 12):
-                            with gr.Column(scale=1, min_width=100):
-                                checkbox = gr.Checkbox(
-                                    label="",
-                                    value=False,
-                                    visible=False
-                                )
-                                image = gr.Image(
-                                    label="",
-                                    height=80,
-                                    width=80,
-                                    interactive=False,
-                                    visible=False,
-                                    show_label=False
-                                )
-                                checkbox_components.append(checkbox)
-                                image_components.append(image)
+                    # 已选图片的下标，按点击顺序保存
+                    selected_indices_state = gr.State([])
             
             # 结果显示区域
             gr.Markdown("## 📹 生成结果")
@@ -293,76 +387,87 @@ class AutoRefreshVideoApp:
                 height=400
             )
             
-            # 自动刷新定时器
-            refresh_timer = gr.Timer(value=5, active=False)
-            
             # 事件处理函数
-            def update_image_display(category):
-                """更新图片显示"""
-                if not category:
-                    updates = []
-                    for i in range(12):
-                        updates.append(gr.update(visible=False, value=False))  # checkbox
-                        updates.append(gr.update(visible=False, value=None))   # image
-                    updates.append("请选择图片分类")
-                    return updates
-                
-                images = self.get_images_for_category(category)
-                updates = []
+            async def update_image_display(category):
+                """更新图片显示（纯内存操作，直接在事件循环上执行，不占用线程池）"""
+                # 网格大小固定，只取前 MAX_TILES 张图片；切换分类时清空选择
+                tiles = self.get_images_for_category(category)[:MAX_TILES] if category else ()
+                gallery_items = [(image_path, str(i + 1)) for i, image_path in enumerate(tiles)]
+                status = self.describe_selection([]) if category else "请选择图片分类"
+                # 同时清除图库自身的选中位置，否则新分类中点击同一位置不会触发 select
+                return gr.update(value=gallery_items, selected_index=None), [], status
+            
+            async def toggle_image_selection(selected_indices, evt: gr.SelectData):
+                """点击图库中的图片：未选中则加入，已选中则移除"""
+                index = evt.index
+                # 图库只在选中位置变化时触发 select，且只能高亮一张；每次点击后清除选中位置，
+                # 再次点击同一张图片才能取消选择，已选图片以选择状态文字为准
+                clear_highlight = gr.update(selected_index=None)
                 
-                for i in range(12):
-                    if i < len(images):
-                        updates.append(gr.update(visible=True, value=False))   # checkbox
-                        updates.append(gr.update(visible=True, value=images[i]))  # image
-                    else:
-                        updates.append(gr.update(visible=False, value=False))  # checkbox
-                        updates.append(gr.update(visible=False, value=None))   # image
+                if index in selected_indices:
+                    selected_indices = [i for i in selected_indices if i != index]
+                elif len(selected_indices) >= MAX_SELECTED_IMAGES:
+                    return clear_highlight, selected_indices, f"❌ 最多只能选择{MAX_SELECTED_IMAGES}张图片"
+                else:
+                    selected_indices = selected_indices + [index]
                 
-                status = f"📊 请勾选要使用的图片"
-                updates.append(status)
-                return updates
+                return clear_highlight, selected_indices, self.describe_selection(selected_indices)
             
-            def auto_refresh_status(session_id, enabled):
-                """自动刷新状态"""
+            async def stream_status(session_id, enabled):
+                """自动刷新状态：通过同一个连接推送，只在状态变化时更新界面"""
                 if not enabled or not session_id:
-                    return gr.update(), gr.update(), gr.update()
+                    self.stop_watching(session_id)
+                    # 不推送时保持界面不变，避免清空启动时显示的错误信息
+                    yield gr.update(), gr.update(), gr.update()
+                    return
                 
-                # print(f"[{time.strftime('%H:%M:%S')}] 🔄 自动检查状态: {session_id}")
-                return self.check_status(session_id)
+                async for status, video_path, error in self.watch_status(session_id):
+                    yield status, video_path, gr.update(value=error, visible=bool(error.strip()))
             
-            # 组合所有组件用于更新
-            all_image_components = []
-            for i in range(12):
-                all_image_components.append(checkbox_components[i])
-                all_image_components.append(image_components[i])
-            all_image_components.append(selection_status)
+            async def on_start(category, style, selected_indices):
+                """启动生成，并在同一次响应中显示/隐藏错误信息"""
+                status, session_id, error = await self.start_generation(category, style, selected_indices)
+                return status, session_id, gr.update(value=error, visible=bool(error.strip()))
             
             # 绑定事件
             category_radio.change(
                 fn=update_image_display,
                 inputs=[category_radio],
-                outputs=all_image_components
+                outputs=[image_gallery, selected_indices_state, selection_status]
+            )
+            
+            image_gallery.select(
+                fn=toggle_image_selection,
+                inputs=[selected_indices_state],
+                outputs=[image_gallery, selected_indices_state, selection_status]
             )
             
             # 开始生成
             start_result = start_btn.click(
-                fn=self.start_generation,
-                inputs=[category_radio, style_dropdown] + checkbox_components,
-                outputs=[status_display, session_id_state, error_display]
+                fn=on_start,
+                inputs=[category_radio, style_dropdown, selected_indices_state],
+                outputs=[status_display, session_id_state, error_display],
+                concurrency_limit=None
             )
             
-            # 激活定时器
-            start_result.then(
-                fn=lambda session_id: gr.update(active=bool(session_id)),
-                inputs=[session_id_state],
-                outputs=[refresh_timer]
+            # 启动后开始推送状态
+            stream_event = start_result.then(
+                fn=stream_status,
+                inputs=[session_id_state, auto_refresh_enabled],
+                outputs=[status_display, video_player, error_display],
+                show_progress="hidden",
+                concurrency_limit=None
             )
             
-            # 显示/隐藏错误信息
-            start_result.then(
-                fn=lambda error: gr.update(visible=bool(error.strip())),
-                inputs=[error_display],
-                outputs=[error_display]
+            # 切换自动刷新：取消正在进行的推送，重新勾选时继续推送
+            auto_refresh_enabled.change(
+                fn=stream_status,
+                inputs=[session_id_state, auto_refresh_enabled],
+                outputs=[status_display, video_player, error_display],
+                cancels=[stream_event],
+                show_progress="hidden",
+                concurrency_limit=None,
+                trigger_mode="multiple"
             )
             
             # 手动检查
@@ -375,27 +480,6 @@ class AutoRefreshVideoApp:
             #     inputs=[error_display],
             #     outputs=[error_display]
             # )
-            
-            # 自动刷新定时器 - 关键部分
-            refresh_timer.tick(
-                fn=auto_refresh_status,
-                inputs=[session_id_state, auto_refresh_enabled],
-                outputs=[status_display, video_player, error_display]
-            ).then(
-                fn=lambda error: gr.update(visible=bool(error.strip())),
-                inputs=[error_display],
-                outputs=[error_display]
-            ).then(
-                # 根据状态决定是否继续定时器
-                fn=lambda status: gr.update(
-                    active=("生成完成" not in status and 
-                           "生成失败" not in status and 
-                           "自动刷新已停止" not in status and
-                           "没有正在进行的生成任务" not in status)
-                ),
-                inputs=[status_display],
-                outputs=[refresh_timer]
-            )
         
         return interface
     
@@ -411,7 +495,7 @@ def main():
         # 检查图片目录
         images_dir = "images"
         if not os.path.exists(images_dir):
-            logger.error(f"图片目录不存在: {images_dir}")
+            logger.error("图片目录不存在: %s", images_dir)
             print(f"❌ 错误: 图片目录 '{images_dir}' 不存在!")
             return
         
@@ -424,7 +508,7 @@ def main():
         logger.info("🚀 启动AI视频生成器 - 自动刷新版...")
         print("🎬 AI视频生成器 - 自动刷新版启动中...")
         print("✨ 新功能:")
-        print("  🔄 自动刷新 - 每5秒自动检查生成状态")
+        print("  🔄 自动刷新 - 状态变化时自动推送到界面")
         print("  🎯 智能停止 - 完成或失败时自动停止")
         print("  ⏰ 实时反馈 - 显示带时间戳的状态信息")
         print()
@@ -445,7 +529,7 @@ def main():
         logger.info("用户中断应用")
         print("\n👋 应用已停止")
     except Exception as e:
-        logger.error(f"应用启动失败: {str(e)}")
+        logger.error("应用启动失败: %s", e)
         print(f"❌ 应用启动失败: {str(e)}")
         sys.exit(1)
 
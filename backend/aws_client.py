@@ -1,10 +1,15 @@
 import boto3
-import json
+from botocore.config import Config
 import base64
+import io
 import time
 import os
-from typing import List, Dict, Any, Optional
+import secrets
+from typing import Iterable, List, Dict, Any, Optional
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from PIL import Image
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -12,6 +17,83 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on threads used to read and encode images in parallel
+MAX_ENCODE_WORKERS = 8
+
+# Claude gains nothing from images larger than this on the long edge; bigger ones are downscaled
+CLAUDE_MAX_IMAGE_EDGE = 1568
+CLAUDE_JPEG_QUALITY = 85
+
+# Number of encoded images kept per cache (full-size for Nova Reel, downscaled for Claude)
+ENCODED_IMAGE_CACHE_SIZE = 32
+
+# Chunk size used when streaming generated videos from S3 to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Tool Claude is forced to call (Converse toolSpec format), so shot descriptions come back as parsed JSON
+EMIT_SHOTS_TOOL = {
+    "toolSpec": {
+        "name": "emit_shots",
+        "description": "Emit per-image shot descriptions for a Nova Reel multi-shot video",
+        "inputSchema": {
+            "json": {
+                "type": "object",
+                "properties": {
+                    "shots": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "text": {"type": "string"},
+                                "image_index": {"type": "integer"}
+                            },
+                            "required": ["text", "image_index"]
+                        }
+                    }
+                },
+                "required": ["shots"]
+            }
+        }
+    }
+}
+EMIT_SHOTS_TOOL_NAME = EMIT_SHOTS_TOOL["toolSpec"]["name"]
+
+# Nova Reel accepts seeds in the range 0..2147483646
+MAX_NOVA_REEL_SEED = 2147483646
+
+# Shared client configuration: a larger HTTP connection pool and adaptive retries.
+# A short connect timeout fails fast on dead endpoints; the longer read timeout covers
+# multi-image Claude calls and large video downloads that outlast the 60s default.
+CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    connect_timeout=10,
+    read_timeout=120
+)
+
+# The same gallery images are picked again and again across sessions. Encodings are
+# cached by path together with mtime and size, so an edited file is re-read.
+@lru_cache(maxsize=ENCODED_IMAGE_CACHE_SIZE)
+def _encode_file(image_path: str, mtime_ns: int, size: int) -> str:
+    """Read a file and return its contents as a base64 string"""
+    with open(image_path, 'rb') as image_file:
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
+@lru_cache(maxsize=ENCODED_IMAGE_CACHE_SIZE)
+def _load_for_claude(image_path: str, mtime_ns: int, size: int) -> bytes:
+    """Return the image as JPEG bytes, downscaled to CLAUDE_MAX_IMAGE_EDGE if larger"""
+    with Image.open(image_path) as img:
+        if img.format == 'JPEG' and max(img.size) <= CLAUDE_MAX_IMAGE_EDGE:
+            # Already small enough and in the declared format: send the file as-is
+            with open(image_path, 'rb') as image_file:
+                return image_file.read()
+        
+        img.thumbnail((CLAUDE_MAX_IMAGE_EDGE, CLAUDE_MAX_IMAGE_EDGE), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.convert('RGB').save(buffer, 'JPEG', quality=CLAUDE_JPEG_QUALITY, optimize=True)
+        return buffer.getvalue()
+
 class AWSBedrockClient:
     def __init__(self, region_name: str = None):
         """
@@ -22,7 +104,9 @@ class AWSBedrockClient:
         """
         # 如果未提供区域，则从环境变量中获取
         self.region_name = region_name or os.getenv("AWS_REGION", "us-east-1")
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name=self.region_name)
+        self.bedrock_client = boto3.client('bedrock-runtime', region_name=self.region_name, config=CLIENT_CONFIG)
+        # Reused for every video download instead of creating a client per call
+        self.s3_client = boto3.client('s3', region_name=self.region_name, config=CLIENT_CONFIG)
         # 从环境变量中获取 S3 URI
         self.nova_reel_s3_uri = os.getenv("NOVA_REEL_S3_URI", "s3://alex-bedrock-nova-video/uploads/")
         
@@ -37,12 +121,31 @@ class AWSBedrockClient:
             Base64 encoded image string
         """
         try:
-            with open(image_path, 'rb') as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+            stat = os.stat(image_path)
+            return _encode_file(image_path, stat.st_mtime_ns, stat.st_size)
         except Exception as e:
             logger.error(f"Error encoding image {image_path}: {str(e)}")
             raise
     
+    def prepare_image_for_claude(self, image_path: str) -> bytes:
+        """
+        Load an image for Claude, downscaling it to CLAUDE_MAX_IMAGE_EDGE if needed
+        
+        Nova Reel still receives the original bytes from encode_image_to_base64.
+        
+        Args:
+            image_path: Path to the image file
+            
+        Returns:
+            Raw JPEG bytes; the Converse API base64-encodes them on the wire
+        """
+        try:
+            stat = os.stat(image_path)
+            return _load_for_claude(image_path, stat.st_mtime_ns, stat.st_size)
+        except Exception as e:
+            logger.error(f"Error preparing image {image_path} for Claude: {str(e)}")
+            raise
+    
     def call_claude_sonnet(self, images: List[str], style: str, category: str) -> List[Dict[str, Any]]:
         """
         Call Claude Sonnet 3.7 to generate video shot prompts for multi-shot video
@@ -56,23 +159,23 @@ class AWSBedrockClient:
             List of shot dictionaries for Nova Reel multi-shot generation
         """
         try:
-            # Encode images to base64
-            encoded_images = []
-            for i, img_path in enumerate(images):
-                encoded_img = self.encode_image_to_base64(img_path)
-                encoded_images.append({
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/jpeg",
-                        "data": encoded_img
-                    }
-                })
+            # Encode each image once at full size for the Nova Reel shots, plus a
+            # downscaled copy for Claude, which only needs to see the composition.
+            # File reads, decoding and base64 encoding release the GIL, so run them in parallel.
+            with ThreadPoolExecutor(max_workers=min(MAX_ENCODE_WORKERS, len(images))) as executor:
+                nova_results = executor.map(self.encode_image_to_base64, images)
+                claude_results = executor.map(self.prepare_image_for_claude, images)
+                encoded_data = list(nova_results)
+                claude_data = list(claude_results)
+            # Raw bytes go straight into the request; botocore does the base64 encoding
+            image_blocks = [
+                {"image": {"format": "jpeg", "source": {"bytes": image_bytes}}}
+                for image_bytes in claude_data
+            ]
             
             # Create the message content for multi-shot generation
             content = [
                 {
-                    "type": "text",
                     "text": f"""You are an expert video prompt generator for Amazon Nova Reel's multi-shot video generation.
 
 Analyze the provided {len(images)} {category} images and create individual shot descriptions for each image with the following style: {style}.
@@ -84,108 +187,86 @@ For each image, generate a detailed shot description that:
 4. Specifies visual effects and atmosphere suitable for the style
 5. Ensures smooth narrative flow between shots
 
-Please respond with a JSON array containing {len(images)} shot objects, each with:
+Call the emit_shots tool with {len(images)} shot objects, each with:
 - "text": Detailed shot description (50-80 words)
 - "image_index": The index of the corresponding image (0 to {len(images)-1})
 
-The shots should tell a cohesive visual story that flows naturally from one to the next.
-
-Example format:
-[
-  {{"text": "Epic aerial rise revealing the landscape, dramatic documentary style with dark atmospheric mood", "image_index": 0}},
-  {{"text": "Sweeping drone shot across surface, morning sunlight casting long shadows, documentary style", "image_index": 1}}
-]"""
+The shots should tell a cohesive visual story that flows naturally from one to the next."""
                 }
             ]
             
             # Add images to content
-            content.extend(encoded_images)
+            content.extend(image_blocks)
             
-            # Prepare the request body
-            body = {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
+            request = {
+                "modelId": "us.anthropic.claude-3-7-sonnet-20250219-v1:0",
                 "messages": [
                     {
                         "role": "user",
                         "content": content
                     }
-                ]
+                ],
+                "inferenceConfig": {"maxTokens": 1000},
+                "toolConfig": {
+                    "tools": [EMIT_SHOTS_TOOL],
+                    "toolChoice": {"tool": {"name": EMIT_SHOTS_TOOL_NAME}}
+                }
             }
             
             # Call Claude Sonnet 3.7
-            response = self.bedrock_client.invoke_model(
-                modelId="us.anthropic.claude-3-7-sonnet-20250219-v1:0",
-                body=json.dumps(body)
-            )
+            response = self.bedrock_client.converse(**request)
             
-            # Parse response
-            response_body = json.loads(response['body'].read())
-            generated_text = response_body['content'][0]['text']
+            # Parse response: the forced tool call carries the shots as structured input
+            shot_descriptions = None
+            for block in response['output']['message']['content']:
+                tool_use = block.get('toolUse')
+                if tool_use and tool_use['name'] == EMIT_SHOTS_TOOL_NAME:
+                    shot_descriptions = tool_use['input']['shots']
+                    break
+            if shot_descriptions is None:
+                raise ValueError(f"Claude did not call {EMIT_SHOTS_TOOL_NAME} (stopReason: {response.get('stopReason')})")
             
-            logger.info(f"Generated shot descriptions: {generated_text}")
+            logger.info(f"Generated shot descriptions: {shot_descriptions}")
             
-            # Parse JSON response
-            try:
-                # Extract JSON from the response (in case there's extra text)
-                import re
-                json_match = re.search(r'\[.*\]', generated_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group()
-                    shot_descriptions = json.loads(json_str)
-                else:
-                    # Fallback: try to parse the entire response as JSON
-                    shot_descriptions = json.loads(generated_text)
-                
-                # Create shot objects with encoded images
-                shots = []
-                for i, shot_desc in enumerate(shot_descriptions):
-                    if i < len(images):  # Ensure we don't exceed available images
-                        image_index = shot_desc.get('image_index', i)
-                        if image_index < len(images):
-                            shots.append({
-                                "text": shot_desc['text'],
-                                "image": {
-                                    "format": "jpeg",
-                                    "source": {
-                                        "bytes": self.encode_image_to_base64(images[image_index])
-                                    }
+            # Create shot objects with encoded images
+            shots = []
+            for i, shot_desc in enumerate(shot_descriptions):
+                if i < len(images):  # Ensure we don't exceed available images
+                    image_index = shot_desc.get('image_index', i)
+                    # Look the bytes up from the single encoding pass; reject out-of-range indices
+                    if isinstance(image_index, int) and 0 <= image_index < len(encoded_data):
+                        shots.append({
+                            "text": shot_desc['text'],
+                            "image": {
+                                "format": "jpeg",
+                                "source": {
+                                    "bytes": encoded_data[image_index]
                                 }
-                            })
-                
-                logger.info(f"Created {len(shots)} shots for multi-shot video")
-                return shots
-                
-            except (json.JSONDecodeError, KeyError) as e:
-                logger.warning(f"Failed to parse JSON response, falling back to single shot: {e}")
-                # Fallback: create a single shot with all images combined
-                return [{
-                    "text": f"A {style} style video showcasing {category} imagery with cinematic camera movements and smooth transitions",
-                    "image": {
-                        "format": "jpeg", 
-                        "source": {
-                            "bytes": self.encode_image_to_base64(images[0])
-                        }
-                    }
-                }]
+                            }
+                        })
+            
+            logger.info(f"Created {len(shots)} shots for multi-shot video")
+            return shots
             
         except Exception as e:
             logger.error(f"Error calling Claude Sonnet: {str(e)}")
             raise Exception(f"Failed to generate shot descriptions with Claude: {str(e)}")
     
-    def start_async_nova_reel(self, shots: List[Dict[str, Any]], images: List[str]) -> str:
+    def start_async_nova_reel(self, shots: List[Dict[str, Any]], images: List[str], seed: Optional[int] = None) -> str:
         """
         Start asynchronous Amazon Nova Reel multi-shot video generation
         
         Args:
             shots: List of shot dictionaries with text and image data
             images: List of image file paths (for reference)
+            seed: Fixed generation seed for reproducible runs; random when omitted
             
         Returns:
             Job ID for tracking the generation process
         """
         try:
-            import random
+            if seed is None:
+                seed = secrets.randbelow(MAX_NOVA_REEL_SEED + 1)
             
             # Prepare the request body for Nova Reel multi-shot generation
             body = {
@@ -196,7 +277,7 @@ Example format:
                 "videoGenerationConfig": {
                     "fps": 24,
                     "dimension": "1280x720",
-                    "seed": random.randint(0, 2147483648)
+                    "seed": seed
                 }
             }
             
@@ -218,12 +299,13 @@ Example format:
             logger.error(f"Error starting async Nova Reel multi-shot: {str(e)}")
             raise Exception(f"Failed to start multi-shot video generation with Nova Reel: {str(e)}")
     
-    def get_async_nova_reel_result(self, job_id: str) -> Dict[str, Any]:
+    def get_async_nova_reel_result(self, job_id: str, output_path: str) -> Dict[str, Any]:
         """
         Get the result of asynchronous Nova Reel video generation
         
         Args:
             job_id: Job ID returned from start_async_nova_reel
+            output_path: Local file path the video is written to once completed
             
         Returns:
             Dictionary with status and result data
@@ -242,11 +324,11 @@ Example format:
                 s3_uri = output_data_config.get('s3OutputDataConfig', {}).get('s3Uri', '')
                 
                 if s3_uri:
-                    # Download video from S3
-                    video_data = self._download_from_s3(s3_uri)
+                    # Download video from S3 straight to disk
+                    self._download_from_s3(s3_uri, output_path)
                     return {
                         'status': 'completed',
-                        'video_data': video_data,
+                        'video_path': output_path,
                         'message': '视频生成完成'
                     }
                 else:
@@ -255,9 +337,10 @@ Example format:
                         output_data = response['outputDataConfig']['outputData']
                         if 'videoGenerationResult' in output_data:
                             video_data = output_data['videoGenerationResult']['video']
+                            self._write_video_file(output_path, [base64.b64decode(video_data)])
                             return {
                                 'status': 'completed',
-                                'video_data': base64.b64decode(video_data),
+                                'video_path': output_path,
                                 'message': '视频生成完成'
                             }
                     
@@ -292,15 +375,35 @@ Example format:
                 'message': f'获取生成结果时出错: {str(e)}'
             }
     
-    def _download_from_s3(self, s3_uri: str) -> bytes:
+    def _write_video_file(self, output_path: str, chunks: Iterable[bytes]) -> None:
+        """
+        Write video data to a temporary file and move it into place once complete
+        
+        An interrupted download leaves no truncated .mp4 behind that could be
+        mistaken for a finished video.
+        
+        Args:
+            output_path: Final local file path of the video
+            chunks: Video data, written in order
+        """
+        partial_path = f"{output_path}.part"
+        try:
+            with open(partial_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(partial_path, output_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+    
+    def _download_from_s3(self, s3_uri: str, output_path: str) -> None:
         """
-        Download video data from S3
+        Download video from S3, streaming it to a local file
         
         Args:
             s3_uri: S3 URI of the generated video
-            
-        Returns:
-            Video data as bytes
+            output_path: Local file path to write the video to
         """
         try:
             # Parse S3 URI
@@ -311,19 +414,19 @@ Example format:
             s3_path = s3_uri[5:]  # Remove 's3://'
             bucket_name, key = s3_path.split('/', 1)
             
-            # Create S3 client
-            s3_client = boto3.client('s3', region_name=self.region_name)
+            s3_client = self.s3_client
             
             # Try to download output.mp4 first (Nova Reel generates this as the main video)
             try:
                 video_key = f"{key}/output.mp4"
                 logger.info(f"Trying to download: s3://{bucket_name}/{video_key}")
                 response = s3_client.get_object(Bucket=bucket_name, Key=video_key)
-                return response['Body'].read()
             except s3_client.exceptions.NoSuchKey:
                 # If output.mp4 doesn't exist, list files and find any .mp4 file
                 logger.info("output.mp4 not found, looking for other video files...")
-                objects = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=key)
+                # Trailing slash keeps the listing inside this invocation's folder
+                # instead of also matching sibling prefixes (e.g. "abc" vs "abc2/")
+                objects = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=f"{key.rstrip('/')}/")
                 
                 if 'Contents' not in objects:
                     raise Exception("No files found in S3 output directory")
@@ -334,9 +437,12 @@ Example format:
                     if obj_key.endswith('.mp4'):
                         logger.info(f"Found video file: {obj_key}")
                         response = s3_client.get_object(Bucket=bucket_name, Key=obj_key)
-                        return response['Body'].read()
-                
-                raise Exception("No video file (.mp4) found in S3 output directory")
+                        break
+                else:
+                    raise Exception("No video file (.mp4) found in S3 output directory")
+            
+            # Write the body in chunks instead of buffering the whole video in memory
+            self._write_video_file(output_path, response['Body'].iter_chunks(DOWNLOAD_CHUNK_SIZE))
             
         except Exception as e:
             logger.error(f"Error downloading from S3: {str(e)}")
@@ -1,8 +1,12 @@
 import os
 import uuid
 import json
+import time
+import threading
+import tempfile
 from datetime import datetime
-from typing import List, Dict, Any, Callable, Optional
+from types import MappingProxyType
+from typing import List, Dict, Any, Callable, Mapping, Optional, Tuple
 import logging
 
 from .aws_client import AWSBedrockClient
@@ -10,6 +14,41 @@ from .prompt_generator import PromptGenerator
 
 logger = logging.getLogger(__name__)
 
+# Status of a job that is still being generated
+IN_PROGRESS_STATUS = "in_progress"
+
+# Status returned when the check could not tell how the job is doing (a throttled
+# get_async_invoke, a failed S3 download, an unrecognised Bedrock status); the job
+# may still finish, so waiting retries it a limited number of times
+CHECK_FAILED_STATUS = "unknown"
+
+
+def find_missing_files(paths: List[str]) -> List[str]:
+    """
+    Return the paths that do not exist, reading each directory once
+    
+    Selected images usually share a directory, so one scandir replaces a
+    stat per image.
+    
+    Args:
+        paths: File paths to check
+        
+    Returns:
+        Missing paths, in input order
+    """
+    by_dir: Dict[str, set] = {}
+    for path in paths:
+        by_dir.setdefault(os.path.dirname(path), set())
+    
+    for directory, present in by_dir.items():
+        try:
+            with os.scandir(directory or ".") as entries:
+                present.update(entry.name for entry in entries)
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+    
+    return [path for path in paths if os.path.basename(path) not in by_dir[os.path.dirname(path)]]
+
 class VideoGenerator:
     def __init__(self, output_dir: str = "generated_videos"):
         """
@@ -22,12 +61,29 @@ class VideoGenerator:
         self.aws_client = AWSBedrockClient()
         self.prompt_generator = PromptGenerator()
         
+        # Style templates are loaded once and never change afterwards; build the lookups once
+        self._styles = MappingProxyType({
+            category: tuple(styles)
+            for category, styles in self.prompt_generator.get_all_styles().items()
+        })
+        self._flat_styles = tuple(self.prompt_generator.get_flat_style_list())
+        
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
         # Store for tracking async jobs
         self.jobs_file = os.path.join(output_dir, "jobs.json")
-        self.active_jobs = self._load_jobs()
+        # Copy-on-write: published dicts are never mutated, updates build a new dict and
+        # rebind it, so readers always see a consistent snapshot without locking
+        self._jobs = self._load_jobs()
+        # Status checks may run concurrently; serialize job updates and file writes
+        self._jobs_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+    
+    @property
+    def active_jobs(self) -> Mapping[str, Dict]:
+        """Read-only view of the current jobs snapshot"""
+        return MappingProxyType(self._jobs)
     
     def _load_jobs(self) -> Dict[str, Dict]:
         """Load active jobs from file"""
@@ -42,11 +98,41 @@ class VideoGenerator:
     def _save_jobs(self):
         """Save active jobs to file"""
         try:
-            with open(self.jobs_file, 'w', encoding='utf-8') as f:
-                json.dump(self.active_jobs, f, ensure_ascii=False, indent=2)
+            with self._save_lock:
+                # Write a temp file and swap it in, so a crash mid-write can't corrupt jobs.json
+                fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, prefix=".jobs-", suffix=".json")
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        json.dump(self._jobs, f, ensure_ascii=False, indent=2)
+                    os.replace(tmp_path, self.jobs_file)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
         except Exception as e:
             logger.error(f"Error saving jobs: {str(e)}")
     
+    def _update_job(self, session_id: str, /, **fields) -> Dict[str, Any]:
+        """
+        Publish a job with updated fields and persist it, skipping the write if nothing changed
+        
+        Args:
+            session_id: Session ID of the job to create or update
+            **fields: Fields to set on the job
+            
+        Returns:
+            The job dictionary now stored for the session
+        """
+        with self._jobs_lock:
+            job_info = self._jobs.get(session_id, {})
+            if session_id in self._jobs and all(job_info.get(key) == value for key, value in fields.items()):
+                return job_info
+            job_info = {**job_info, **fields}
+            jobs = dict(self._jobs)
+            jobs[session_id] = job_info
+            self._jobs = jobs
+        self._save_jobs()
+        return job_info
+    
     def start_async_video_generation(
         self, 
         images: List[str], 
@@ -72,17 +158,17 @@ class VideoGenerator:
             if len(images) > 8:  # Nova Reel 1.1 supports up to 8 shots
                 raise ValueError("Maximum 8 images allowed for multi-shot video")
             
-            # Validate image files exist
-            for img_path in images:
-                if not os.path.exists(img_path):
-                    raise FileNotFoundError(f"Image file not found: {img_path}")
+            # Validate image files exist, reporting every missing file at once
+            missing = find_missing_files(images)
+            if missing:
+                raise FileNotFoundError(f"Image file not found: {', '.join(missing)}")
             
-            logger.info(f"Starting async multi-shot video generation with {len(images)} images, style: {style}, category: {category}")
+            logger.info("Starting async multi-shot video generation with %d images, style: %s, category: %s", len(images), style, category)
             
             # Step 1: Generate shot descriptions using Claude Sonnet
             shots = self.aws_client.call_claude_sonnet(images, style, category)
             
-            logger.info(f"Generated {len(shots)} shot descriptions for multi-shot video")
+            logger.info("Generated %d shot descriptions for multi-shot video", len(shots))
             
             # Step 2: Start async multi-shot video generation using Nova Reel
             job_id = self.aws_client.start_async_nova_reel(shots, images)
@@ -99,16 +185,17 @@ class VideoGenerator:
                 "images": images,
                 "style": style,
                 "category": category,
-                "shots": shots,
+                # Only the shot text is kept: the base64 image data would make up nearly all
+                # of jobs.json and is already recoverable from "images"
+                "shots": [{"text": shot["text"]} for shot in shots],
                 "images_count": len(images),
                 "shots_count": len(shots),
                 "generation_type": "multi_shot"
             }
             
-            self.active_jobs[session_id] = job_info
-            self._save_jobs()
+            self._update_job(session_id, **job_info)
             
-            logger.info(f"Started async multi-shot video generation with session ID: {session_id}")
+            logger.info("Started async multi-shot video generation with session ID: %s", session_id)
             
             return {
                 "status": "success",
@@ -139,50 +226,40 @@ class VideoGenerator:
             Dictionary with current status and result if completed
         """
         try:
-            if session_id not in self.active_jobs:
+            job_info = self._jobs.get(session_id)
+            if job_info is None:
                 return {
                     "status": "error",
                     "message": "未找到对应的生成任务"
                 }
             
-            job_info = self.active_jobs[session_id]
             job_id = job_info["job_id"]
             
-            # Check status with AWS
-            result = self.aws_client.get_async_nova_reel_result(job_id)
+            # A finished job keeps its local video; don't query AWS or download again
+            if job_info.get("status") == "completed" and os.path.exists(job_info.get("video_path", "")):
+                return self._completed_response(job_info)
+            
+            # Check status with AWS; a completed video is streamed straight to this path
+            video_filename = f"video_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+            video_path = os.path.join(self.output_dir, video_filename)
+            result = self.aws_client.get_async_nova_reel_result(job_id, video_path)
             
             if result['status'] == 'completed':
-                # Save video file
-                video_filename = f"video_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
-                video_path = os.path.join(self.output_dir, video_filename)
-                
-                with open(video_path, 'wb') as f:
-                    f.write(result['video_data'])
-                
-                logger.info(f"Video saved to: {video_path}")
+                logger.info("Video saved to: %s", video_path)
                 
                 # Update job status
-                job_info["status"] = "completed"
-                job_info["completed_at"] = datetime.now().isoformat()
-                job_info["video_path"] = video_path
-                job_info["video_filename"] = video_filename
-                self._save_jobs()
+                job_info = self._update_job(
+                    session_id,
+                    status="completed",
+                    completed_at=datetime.now().isoformat(),
+                    video_path=video_path,
+                    video_filename=video_filename
+                )
                 
-                return {
-                    "status": "completed",
-                    "message": "多镜头视频生成完成",
-                    "video_path": video_path,
-                    "video_filename": video_filename,
-                    "shots_count": job_info.get("shots_count", len(job_info.get("shots", []))),
-                    "images_count": job_info["images_count"],
-                    "style": job_info["style"],
-                    "category": job_info["category"],
-                    "generation_type": job_info.get("generation_type", "multi_shot")
-                }
+                return self._completed_response(job_info)
             
             elif result['status'] == 'in_progress':
-                job_info["status"] = "in_progress"
-                self._save_jobs()
+                self._update_job(session_id, status="in_progress")
                 
                 return {
                     "status": "in_progress",
@@ -190,9 +267,7 @@ class VideoGenerator:
                 }
             
             elif result['status'] == 'failed':
-                job_info["status"] = "failed"
-                job_info["error_message"] = result['message']
-                self._save_jobs()
+                self._update_job(session_id, status="failed", error_message=result['message'])
                 
                 return {
                     "status": "failed",
@@ -201,7 +276,7 @@ class VideoGenerator:
             
             else:
                 return {
-                    "status": "unknown",
+                    "status": CHECK_FAILED_STATUS,
                     "message": result.get('message', '未知状态')
                 }
                 
@@ -243,17 +318,87 @@ class VideoGenerator:
                 "error_details": str(e)
             }
     
-    def get_available_styles(self) -> Dict[str, list]:
-        """Get all available styles"""
-        return self.prompt_generator.get_all_styles()
+    def wait_for_async_video(
+        self,
+        session_id: str,
+        initial_interval: float = 1.0,
+        max_interval: float = 60.0,
+        backoff: float = 2.0,
+        timeout: float = 1800.0,
+        max_check_errors: int = 3
+    ) -> Dict[str, Any]:
+        """
+        Poll an async video job until it finishes, backing off between checks
+        
+        Short jobs are noticed within a second or two, while long ones settle at
+        max_interval instead of hitting Bedrock at a fixed rate.
+        
+        Args:
+            session_id: Session ID returned from start_async_video_generation
+            initial_interval: Seconds to wait before the second check
+            max_interval: Upper bound on the wait between checks in seconds
+            backoff: Factor the wait grows by after each unfinished check
+            timeout: Give up after this many seconds
+            max_check_errors: Consecutive inconclusive status checks tolerated
+                before the last one is returned
+            
+        Returns:
+            The final status dictionary from check_async_video_status, or a
+            timeout status if the job did not finish in time. A missing session
+            is returned straight away.
+        """
+        deadline = time.monotonic() + timeout
+        interval = initial_interval
+        check_errors = 0
+        
+        while True:
+            result = self.check_async_video_status(session_id)
+            if result["status"] == CHECK_FAILED_STATUS:
+                check_errors += 1
+                if check_errors >= max_check_errors:
+                    return result
+                logger.warning("Status check failed (%d/%d), retrying: %s",
+                               check_errors, max_check_errors, result.get("message"))
+            elif result["status"] != IN_PROGRESS_STATUS:
+                return result
+            else:
+                check_errors = 0
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {
+                    "status": "timeout",
+                    "message": f"等待视频生成超时 ({timeout:.0f} 秒)"
+                }
+            
+            time.sleep(min(interval, remaining))
+            interval = min(max_interval, interval * backoff)
+    
+    def _completed_response(self, job_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the status response for a completed job"""
+        return {
+            "status": "completed",
+            "message": "多镜头视频生成完成",
+            "video_path": job_info["video_path"],
+            "video_filename": job_info["video_filename"],
+            "shots_count": job_info.get("shots_count", len(job_info.get("shots", []))),
+            "images_count": job_info["images_count"],
+            "style": job_info["style"],
+            "category": job_info["category"],
+            "generation_type": job_info.get("generation_type", "multi_shot")
+        }
+    
+    def get_available_styles(self) -> Mapping[str, Tuple[str, ...]]:
+        """Get all available styles (read-only, cached)"""
+        return self._styles
     
-    def get_flat_style_list(self) -> list:
-        """Get flat list of all styles"""
-        return self.prompt_generator.get_flat_style_list()
+    def get_flat_style_list(self) -> Tuple[str, ...]:
+        """Get flat list of all styles (cached)"""
+        return self._flat_styles
     
-    def get_active_jobs(self) -> Dict[str, Dict]:
-        """Get all active jobs"""
-        return self.active_jobs.copy()
+    def get_active_jobs(self) -> Mapping[str, Dict]:
+        """Get all active jobs as a read-only snapshot (no copy)"""
+        return self.active_jobs
     
     def cleanup_old_videos(self, max_age_hours: int = 24):
         """
@@ -263,18 +408,14 @@ class VideoGenerator:
             max_age_hours: Maximum age of videos to keep in hours
         """
         try:
-            current_time = datetime.now()
-            
-            for filename in os.listdir(self.output_dir):
-                if filename.endswith('.mp4'):
-                    file_path = os.path.join(self.output_dir, filename)
-                    file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                    
-                    age_hours = (current_time - file_time).total_seconds() / 3600
-                    
-                    if age_hours > max_age_hours:
-                        os.remove(file_path)
-                        logger.info(f"Cleaned up old video: {filename}")
+            cutoff = time.time() - max_age_hours * 3600
+            
+            # scandir yields entries with cached stat data, one directory read instead of a stat per file
+            with os.scandir(self.output_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.mp4') and entry.stat().st_ctime < cutoff:
+                        os.remove(entry.path)
+                        logger.info("Cleaned up old video: %s", entry.name)
                         
         except Exception as e:
             logger.error(f"Error cleaning up videos: {str(e)}")
@@ -307,16 +448,16 @@ class VideoGenerator:
             if len(images) > 6:
                 raise ValueError("Maximum 6 images allowed")
             
-            # Validate image files exist
-            for img_path in images:
-                if not os.path.exists(img_path):
-                    raise FileNotFoundError(f"Image file not found: {img_path}")
+            # Validate image files exist, reporting every missing file at once
+            missing = find_missing_files(images)
+            if missing:
+                raise FileNotFoundError(f"Image file not found: {', '.join(missing)}")
             
             # Update progress
             if progress_callback:
                 progress_callback("正在分析图片...")
             
-            logger.info(f"Starting video generation with {len(images)} images, style: {style}, category: {category}")
+            logger.info("Starting video generation with %d images, style: %s, category: %s", len(images), style, category)
             
             # Step 1: Generate prompt using Claude Sonnet
             if progress_callback:
@@ -327,7 +468,7 @@ class VideoGenerator:
             # Enhance prompt with style information
             enhanced_prompt = self.prompt_generator.enhance_prompt_with_style(base_prompt, style)
             
-            logger.info(f"Generated enhanced prompt: {enhanced_prompt}")
+            logger.info("Generated enhanced prompt: %s", enhanced_prompt)
             
             # Step 2: Generate video using Nova Reel (synchronous)
             if progress_callback:
@@ -340,13 +481,14 @@ class VideoGenerator:
                 raise Exception("Synchronous video generation not available. Please use async method.")
             
             # Step 3: Save video file
-            video_filename = f"video_{uuid.uuid4().hex}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+            # Process ID plus a nanosecond timestamp is unique without drawing random bytes
+            video_filename = f"video_{os.getpid()}_{time.time_ns()}.mp4"
             video_path = os.path.join(self.output_dir, video_filename)
             
             with open(video_path, 'wb') as f:
                 f.write(video_data)
             
-            logger.info(f"Video saved to: {video_path}")
+            logger.info("Video saved to: %s", video_path)
             
             # Update progress
             if progress_callback:
@@ -3,8 +3,9 @@
 检查当前视频生成任务的状态
 """
 
-import json
-import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -12,18 +13,39 @@ load_dotenv()
 
 from backend.video_generator import VideoGenerator
 
+# 同时查询的任务数上限
+MAX_PARALLEL_CHECKS = 16
+
 def main():
-    # 创建视频生成器实例
+    parser = argparse.ArgumentParser(description='检查视频生成任务的状态')
+    parser.add_argument('--wait', action='store_true', help='等待未完成的任务结束（轮询间隔逐步加长）')
+    parser.add_argument('--timeout', type=float, default=1800, help='等待每个任务的最长时间（秒），默认 1800')
+    args = parser.parse_args()
+    
+    # 创建视频生成器实例，任务列表由它从 jobs.json 加载
     generator = VideoGenerator()
+    jobs = generator.get_active_jobs()
     
-    # 读取jobs.json文件
-    jobs_file = "generated_videos/jobs.json"
-    if not os.path.exists(jobs_file):
-        print("没有找到任务文件")
+    if not jobs:
+        print("没有找到任务")
         return
     
-    with open(jobs_file, 'r', encoding='utf-8') as f:
-        jobs = json.load(f)
+    # 未完成的任务并发查询，总耗时约等于最慢的一次请求，而不是所有请求之和
+    pending = [
+        session_id for session_id, job_info in jobs.items()
+        if job_info.get('status') in ['started', 'in_progress']
+    ]
+    if args.wait:
+        check = partial(generator.wait_for_async_video, timeout=args.timeout)
+        print(f"正在等待 {len(pending)} 个未完成的任务...")
+    else:
+        check = generator.check_async_video_status
+        print(f"正在检查 {len(pending)} 个未完成任务的最新状态...")
+    
+    results = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CHECKS, len(pending))) as executor:
+            results = dict(zip(pending, executor.map(check, pending)))
     
     print(f"找到 {len(jobs)} 个任务:")
     print("-" * 50)
@@ -35,10 +57,9 @@ def main():
         print(f"图片数量: {job_info.get('images_count', 0)}")
         print(f"风格: {job_info.get('style', '未知')}")
         
-        # 检查当前状态
-        if job_info.get('status') in ['started', 'in_progress']:
-            print("正在检查最新状态...")
-            result = generator.check_async_video_status(session_id)
+        # 显示最新状态
+        result = results.get(session_id)
+        if result:
             print(f"最新状态: {result['status']}")
             print(f"消息: {result.get('message', '无消息')}")
             
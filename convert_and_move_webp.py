@@ -5,8 +5,56 @@
 import os
 import shutil
 import glob
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from PIL import Image
 
+# JPEG输出参数：基线编码、不做额外的霍夫曼优化遍历，色度4:2:0采样
+JPEG_SAVE_OPTIONS = {'quality': 95, 'optimize': False, 'progressive': False, 'subsampling': '4:2:0'}
+
+def convert_one(webp_file, bak_dir):
+    """
+    转换单个WebP文件并移动原文件，在子进程中运行
+    返回要输出的日志行，由主进程统一打印，避免多进程输出交错
+    """
+    messages = []
+    try:
+        # 1. 转换为JPEG
+        with Image.open(webp_file) as img:
+            # 创建新的JPEG文件名（替换扩展名）
+            jpeg_file = os.path.splitext(webp_file)[0] + ".jpeg"
+            
+            # 如果图片有透明通道，需要先叠加到白色背景上再转换为RGB
+            alpha = None
+            if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+                if img.mode == 'P':
+                    img = img.convert('RGBA')
+                alpha = img.getchannel('A')
+                # 完全不透明（常见于由JPEG转来的WebP）时跳过合成
+                if alpha.getextrema() == (255, 255):
+                    alpha = None
+            
+            if alpha is not None:
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=alpha)
+                background.save(jpeg_file, 'JPEG', **JPEG_SAVE_OPTIONS)
+            else:
+                # 保存为JPEG格式
+                img.convert('RGB').save(jpeg_file, 'JPEG', **JPEG_SAVE_OPTIONS)
+            
+            messages.append(f"已转换: {os.path.basename(webp_file)} -> {os.path.basename(jpeg_file)}")
+        
+        # 2. 移动原始WebP文件到bak目录
+        filename = os.path.basename(webp_file)
+        dest_path = os.path.join(bak_dir, filename)
+        shutil.move(webp_file, dest_path)
+        messages.append(f"已移动: {filename} -> {bak_dir}")
+        
+    except Exception as e:
+        messages.append(f"处理 {webp_file} 时出错: {e}")
+    
+    return messages
+
 def convert_and_move_webp(source_dir, bak_dir):
     """
     将指定目录中的所有WebP图片转换为JPEG格式，并将原始WebP文件移动到bak目录
@@ -25,32 +73,11 @@ def convert_and_move_webp(source_dir, bak_dir):
     
     print(f"找到 {len(webp_files)} 个WebP文件，开始处理...")
     
-    for webp_file in webp_files:
-        try:
-            # 1. 转换为JPEG
-            with Image.open(webp_file) as img:
-                # 创建新的JPEG文件名（替换扩展名）
-                jpeg_file = os.path.splitext(webp_file)[0] + ".jpeg"
-                
-                # 如果图片有透明通道，需要先转换为RGB
-                if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.convert('RGBA').split()[3])
-                    background.save(jpeg_file, 'JPEG', quality=95)
-                else:
-                    # 保存为JPEG格式
-                    img.convert('RGB').save(jpeg_file, 'JPEG', quality=95)
-                
-                print(f"已转换: {os.path.basename(webp_file)} -> {os.path.basename(jpeg_file)}")
-            
-            # 2. 移动原始WebP文件到bak目录
-            filename = os.path.basename(webp_file)
-            dest_path = os.path.join(bak_dir, filename)
-            shutil.move(webp_file, dest_path)
-            print(f"已移动: {filename} -> {bak_dir}")
-            
-        except Exception as e:
-            print(f"处理 {webp_file} 时出错: {e}")
+    # 解码和JPEG编码是CPU密集型操作，每个文件交给一个子进程处理
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(webp_files))) as executor:
+        for messages in executor.map(partial(convert_one, bak_dir=bak_dir), webp_files):
+            for message in messages:
+                print(message)
 
 if __name__ == "__main__":
     # 设置源目录和目标目录
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
 import os
+import errno
+import importlib.util
 import sys
+import time
 import shutil
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from PIL import Image, UnidentifiedImageError
 import logging
-from typing import Tuple
+from typing import FrozenSet, Iterator, Tuple
 
 # 配置日志
 logging.basicConfig(
@@ -19,7 +25,59 @@ logger = logging.getLogger(__name__)
 TARGET_WIDTH = 1280
 TARGET_HEIGHT = 720
 
-def resize_and_crop_image(image_path: str, bak_dir: str) -> bool:
+# 默认保存质量
+DEFAULT_QUALITY = 95
+
+# 支持的图片扩展名（小写）
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff', '.tif'})
+
+# Image.reduce 不支持调色板(P)、1位(1)和16位(I;16)等模式，这些模式走普通 resize
+REDUCE_MODES = frozenset({'L', 'LA', 'La', 'RGB', 'RGBA', 'RGBa', 'RGBX', 'CMYK', 'YCbCr', 'LAB', 'HSV', 'I', 'F'})
+
+def get_save_options(image_path: str, quality: int) -> dict:
+    """
+    按输出格式选择保存参数
+    
+    JPEG 使用基线编码、不做额外的霍夫曼优化遍历；WebP 使用中等压缩速度
+    
+    Args:
+        image_path: 输出图片路径，格式由扩展名决定
+        quality: 保存质量 (1-100)
+        
+    Returns:
+        dict: 传给 Image.save 的参数
+    """
+    ext = os.path.splitext(image_path)[1].lower()
+    if ext in ('.jpg', '.jpeg'):
+        return {'quality': quality, 'optimize': False, 'progressive': False, 'subsampling': '4:2:0'}
+    if ext == '.webp':
+        return {'quality': quality, 'method': 4}
+    return {'quality': quality}
+
+def backup_original(image_path: str, bak_dir: str) -> str:
+    """
+    将原图片移动到备份目录
+    
+    Args:
+        image_path: 图片路径
+        bak_dir: 备份目录路径
+        
+    Returns:
+        str: 备份后的路径
+    """
+    backup_path = os.path.join(bak_dir, os.path.basename(image_path))
+    try:
+        # 同一文件系统内只需重命名，不复制数据
+        os.rename(image_path, backup_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        logger.warning("备份目录 %s 与图片不在同一文件系统，将复制原图片", bak_dir)
+        shutil.move(image_path, backup_path)
+    logger.debug("原图片已备份到 %s", backup_path)
+    return backup_path
+
+def resize_and_crop_image(image_path: str, bak_dir: str, quality: int = DEFAULT_QUALITY) -> bool:
     """
     调整图片尺寸为1280x720，并将原图片移动到备份目录
     
@@ -30,6 +88,7 @@ def resize_and_crop_image(image_path: str, bak_dir: str) -> bool:
     Args:
         image_path: 图片路径
         bak_dir: 备份目录路径
+        quality: 保存质量 (1-100)
         
     Returns:
         bool: 处理是否成功
@@ -38,104 +97,231 @@ def resize_and_crop_image(image_path: str, bak_dir: str) -> bool:
         # 确保备份目录存在
         os.makedirs(bak_dir, exist_ok=True)
         
+        # 一次性把文件读入内存再解码，避免解码过程中对文件的大量小块读取（网络存储上尤其明显）
+        buffer = bytearray(os.path.getsize(image_path))
+        with open(image_path, 'rb', buffering=0) as f:
+            # 无缓冲读取可能一次读不满，循环直到读完
+            view = memoryview(buffer)
+            while view:
+                read = f.readinto(view)
+                if not read:
+                    break
+                view = view[read:]
+        
         # 打开图片
-        with Image.open(image_path) as img:
+        with Image.open(io.BytesIO(buffer)) as img:
             # 获取原始尺寸
             orig_width, orig_height = img.size
             
             # 检查图片是否已经是目标尺寸
             if orig_width == TARGET_WIDTH and orig_height == TARGET_HEIGHT:
-                logger.info(f"图片 {image_path} 已经是目标尺寸 {TARGET_WIDTH}x{TARGET_HEIGHT}，无需处理")
+                logger.debug("图片 %s 已经是目标尺寸 %dx%d，无需处理", image_path, TARGET_WIDTH, TARGET_HEIGHT)
                 return True
             
-            logger.info(f"处理图片 {image_path}，原始尺寸: {orig_width}x{orig_height}")
+            logger.debug("处理图片 %s，原始尺寸: %dx%d", image_path, orig_width, orig_height)
             
-            # 计算调整后的尺寸和裁剪区域
-            new_size, crop_box = calculate_resize_and_crop(orig_width, orig_height)
+            # 大尺寸JPEG让libjpeg在解码时直接按1/2、1/4、1/8缩小，保留至少2倍目标尺寸供LANCZOS使用
+            if img.format == 'JPEG':
+                img.draft(img.mode, (TARGET_WIDTH * 2, TARGET_HEIGHT * 2))
+            decoded_width, decoded_height = img.size
             
-            # 调整图片尺寸
-            resized_img = img.resize(new_size, Image.LANCZOS)
+            # 计算输出尺寸和原图中对应的裁剪区域（按解码后的尺寸）
+            new_size, source_box = calculate_resize_and_crop(decoded_width, decoded_height)
             
-            # 裁剪图片
-            cropped_img = resized_img.crop(crop_box)
+            left, top, right, bottom = source_box
+            factor = round((right - left) / TARGET_WIDTH)
+            integer_multiple = (factor >= 1
+                                and abs((right - left) - TARGET_WIDTH * factor) < 1e-6
+                                and abs((bottom - top) - TARGET_HEIGHT * factor) < 1e-6)
+            # 裁剪区域正好是目标尺寸的整数倍：1倍时直接裁剪，否则用整数倍降采样，不需要LANCZOS卷积
+            integer_box = (int(left), int(top), int(left) + TARGET_WIDTH * factor, int(top) + TARGET_HEIGHT * factor)
+            if integer_multiple and factor == 1:
+                cropped_img = img.crop(integer_box)
+            elif integer_multiple and img.mode in REDUCE_MODES:
+                cropped_img = img.reduce(factor, box=integer_box)
+            else:
+                # 直接从原图的裁剪区域重采样到目标尺寸，不生成放大/缩小后的中间大图；
+                # 大幅缩小时先按整数倍快速降采样，剩余不足3倍的部分再用LANCZOS
+                cropped_img = img.resize(new_size, Image.LANCZOS, box=source_box, reducing_gap=3.0)
             
             # 备份原图片
-            backup_path = os.path.join(bak_dir, os.path.basename(image_path))
-            shutil.move(image_path, backup_path)
-            logger.info(f"原图片已备份到 {backup_path}")
+            backup_original(image_path, bak_dir)
             
             # 保存处理后的图片
-            cropped_img.save(image_path, quality=95)
-            logger.info(f"处理后的图片已保存到 {image_path}，新尺寸: {TARGET_WIDTH}x{TARGET_HEIGHT}")
+            cropped_img.save(image_path, **get_save_options(image_path, quality))
+            logger.debug("处理后的图片已保存到 %s，新尺寸: %dx%d", image_path, TARGET_WIDTH, TARGET_HEIGHT)
             
             return True
             
+    except UnidentifiedImageError:
+        logger.error(f"文件 {image_path} 不是有效的图片")
+        return False
     except Exception as e:
         logger.error(f"处理图片 {image_path} 时出错: {str(e)}")
         return False
 
-def calculate_resize_and_crop(orig_width: int, orig_height: int) -> Tuple[Tuple[int, int], Tuple[int, int, int, int]]:
+def resize_and_crop_image_vips(image_path: str, bak_dir: str, quality: int = DEFAULT_QUALITY) -> bool:
     """
-    计算调整尺寸和裁剪区域
+    使用 pyvips 调整图片尺寸为1280x720，并将原图片移动到备份目录
+    
+    pyvips 的 thumbnail 按需分块处理，JPEG 在解码时直接缩小，不会把整张原图载入内存；
+    缩放规则与 resize_and_crop_image 相同（覆盖目标尺寸后居中裁剪）
     
     Args:
-        orig_width: 原始宽度
-        orig_height: 原始高度
+        image_path: 图片路径
+        bak_dir: 备份目录路径
+        quality: 保存质量 (1-100)
         
     Returns:
-        Tuple[Tuple[int, int], Tuple[int, int, int, int]]: 
-            - 第一个元组是调整后的尺寸 (width, height)
-            - 第二个元组是裁剪区域 (left, top, right, bottom)
-    """
-    # 计算原始宽高比
-    orig_ratio = orig_width / orig_height
-    target_ratio = TARGET_WIDTH / TARGET_HEIGHT
-    
-    # 情况1: 如果原图有一边小于目标尺寸，需要放大
-    if orig_width < TARGET_WIDTH or orig_height < TARGET_HEIGHT:
-        # 计算放大比例
-        if orig_width < TARGET_WIDTH and orig_height < TARGET_HEIGHT:
-            # 两边都小于目标尺寸，选择放大比例较大的一边
-            scale_w = TARGET_WIDTH / orig_width
-            scale_h = TARGET_HEIGHT / orig_height
-            scale = max(scale_w, scale_h)
-        elif orig_width < TARGET_WIDTH:
-            # 宽度小于目标宽度
-            scale = TARGET_WIDTH / orig_width
-        else:
-            # 高度小于目标高度
-            scale = TARGET_HEIGHT / orig_height
+        bool: 处理是否成功
+    """
+    # pyvips 是可选依赖，只在选择该引擎时导入
+    import pyvips
+    
+    try:
+        # 确保备份目录存在
+        os.makedirs(bak_dir, exist_ok=True)
         
-        # 计算放大后的尺寸
-        new_width = int(orig_width * scale)
-        new_height = int(orig_height * scale)
+        # 只读取文件头获取尺寸
+        image = pyvips.Image.new_from_file(image_path, access='sequential')
+        orig_width, orig_height = image.width, image.height
         
-    # 情况2: 如果原图两边都大于目标尺寸，需要缩小
-    else:
-        # 计算缩小比例
-        scale_w = TARGET_WIDTH / orig_width
-        scale_h = TARGET_HEIGHT / orig_height
-        scale = max(scale_w, scale_h)  # 选择较大的比例，确保至少一边达到目标尺寸
+        # 检查图片是否已经是目标尺寸
+        if orig_width == TARGET_WIDTH and orig_height == TARGET_HEIGHT:
+            logger.debug("图片 %s 已经是目标尺寸 %dx%d，无需处理", image_path, TARGET_WIDTH, TARGET_HEIGHT)
+            return True
+        
+        logger.debug("处理图片 %s，原始尺寸: %dx%d", image_path, orig_width, orig_height)
+        
+        # 缩放到覆盖目标尺寸并居中裁剪，一次完成
+        thumbnail = pyvips.Image.thumbnail(image_path, TARGET_WIDTH, height=TARGET_HEIGHT, crop='centre')
+        
+        # 先编码到内存，确认成功后再移动原图片
+        ext = os.path.splitext(image_path)[1].lower()
+        save_options = {'Q': quality} if ext in ('.jpg', '.jpeg', '.webp') else {}
+        data = thumbnail.write_to_buffer(ext, **save_options)
+        
+        # 备份原图片
+        backup_original(image_path, bak_dir)
+        
+        # 保存处理后的图片
+        with open(image_path, 'wb') as f:
+            f.write(data)
+        logger.debug("处理后的图片已保存到 %s，新尺寸: %dx%d", image_path, TARGET_WIDTH, TARGET_HEIGHT)
+        
+        return True
+        
+    except Exception as e:
+        logger.error(f"处理图片 {image_path} 时出错: {str(e)}")
+        return False
+
+def resize_and_crop_image_scipy(image_path: str, bak_dir: str, quality: int = DEFAULT_QUALITY) -> bool:
+    """
+    使用 scipy.ndimage.zoom 三次样条插值调整图片尺寸为1280x720，并将原图片移动到备份目录
+    
+    读写图片仍使用 Pillow，只有重采样由 SciPy 的向量化实现完成；
+    缩放规则与 resize_and_crop_image 相同（覆盖目标尺寸后居中裁剪）
+    
+    Args:
+        image_path: 图片路径
+        bak_dir: 备份目录路径
+        quality: 保存质量 (1-100)
         
-        # 计算缩小后的尺寸
-        new_width = int(orig_width * scale)
-        new_height = int(orig_height * scale)
+    Returns:
+        bool: 处理是否成功
+    """
+    # numpy/scipy 是可选依赖，只在选择该引擎时导入
+    import numpy as np
+    from scipy import ndimage
     
-    # 计算裁剪区域，居中裁剪
-    left = (new_width - TARGET_WIDTH) // 2
-    top = (new_height - TARGET_HEIGHT) // 2
-    right = left + TARGET_WIDTH
-    bottom = top + TARGET_HEIGHT
+    try:
+        # 确保备份目录存在
+        os.makedirs(bak_dir, exist_ok=True)
+        
+        with Image.open(image_path) as img:
+            orig_width, orig_height = img.size
+            
+            # 检查图片是否已经是目标尺寸
+            if orig_width == TARGET_WIDTH and orig_height == TARGET_HEIGHT:
+                logger.debug("图片 %s 已经是目标尺寸 %dx%d，无需处理", image_path, TARGET_WIDTH, TARGET_HEIGHT)
+                return True
+            
+            logger.debug("处理图片 %s，原始尺寸: %dx%d", image_path, orig_width, orig_height)
+            
+            # 先按整数像素裁剪出需要的区域，只对这部分做插值
+            _, (left, top, right, bottom) = calculate_resize_and_crop(orig_width, orig_height)
+            region = img.crop((round(left), round(top), round(right), round(bottom)))
+            if region.mode not in ('L', 'RGB', 'RGBA'):
+                region = region.convert('RGB')
+            pixels = np.asarray(region, dtype=np.float32)
+        
+        # 高、宽方向分别缩放到目标尺寸，颜色通道不缩放
+        region_height, region_width = pixels.shape[:2]
+        zoom = (TARGET_HEIGHT / region_height, TARGET_WIDTH / region_width) + (1,) * (pixels.ndim - 2)
+        resized = ndimage.zoom(pixels, zoom, order=3, mode='reflect')
+        # 三次样条会有轻微过冲，截断到有效范围后再转回 8 位
+        resized = np.clip(np.rint(resized), 0, 255).astype(np.uint8)
+        
+        # 备份原图片
+        backup_original(image_path, bak_dir)
+        
+        # 保存处理后的图片
+        Image.fromarray(resized).save(image_path, **get_save_options(image_path, quality))
+        logger.debug("处理后的图片已保存到 %s，新尺寸: %dx%d", image_path, TARGET_WIDTH, TARGET_HEIGHT)
+        
+        return True
+        
+    except UnidentifiedImageError:
+        logger.error(f"文件 {image_path} 不是有效的图片")
+        return False
+    except Exception as e:
+        logger.error(f"处理图片 {image_path} 时出错: {str(e)}")
+        return False
+
+def calculate_resize_and_crop(orig_width: int, orig_height: int) -> Tuple[Tuple[int, int], Tuple[float, float, float, float]]:
+    """
+    计算输出尺寸和原图中的裁剪区域
     
-    return (new_width, new_height), (left, top, right, bottom)
+    Args:
+        orig_width: 原始宽度
+        orig_height: 原始高度
+        
+    Returns:
+        Tuple[Tuple[int, int], Tuple[float, float, float, float]]: 
+            - 第一个元组是输出尺寸 (width, height)
+            - 第二个元组是原图坐标中的居中裁剪区域 (left, top, right, bottom)，
+              缩放后正好是输出尺寸，可直接作为 resize 的 box 参数
+    """
+    # 放大和缩小用的是同一个比例：取两边比例中较大的一个，保证两边都能覆盖目标尺寸
+    scale = max(TARGET_WIDTH / orig_width, TARGET_HEIGHT / orig_height)
+    
+    # 缩放后的目标区域对应到原图中的大小，居中裁剪
+    source_width = TARGET_WIDTH / scale
+    source_height = TARGET_HEIGHT / scale
+    # 浮点误差可能让边界略微越出原图，Pillow 会拒绝这样的 box，因此限制在原图范围内
+    left = max(0.0, (orig_width - source_width) / 2)
+    top = max(0.0, (orig_height - source_height) / 2)
+    right = min(float(orig_width), left + source_width)
+    bottom = min(float(orig_height), top + source_height)
+    
+    return (TARGET_WIDTH, TARGET_HEIGHT), (left, top, right, bottom)
+
+# 可选的处理引擎
+RESIZE_ENGINES = {
+    'pillow': resize_and_crop_image,
+    'vips': resize_and_crop_image_vips,
+    'scipy': resize_and_crop_image_scipy,
+}
 
-def process_image(image_path: str, bak_dir: str = "bak") -> bool:
+def process_image(image_path: str, bak_dir: str = "bak", quality: int = DEFAULT_QUALITY, engine: str = "pillow") -> bool:
     """
     处理单个图片
     
     Args:
         image_path: 图片路径
         bak_dir: 备份目录路径，默认为"bak"
+        quality: 保存质量 (1-100)，默认为95
+        engine: 处理引擎，见 RESIZE_ENGINES，默认为"pillow"
         
     Returns:
         bool: 处理是否成功
@@ -145,24 +331,70 @@ def process_image(image_path: str, bak_dir: str = "bak") -> bool:
         logger.error(f"图片 {image_path} 不存在")
         return False
     
-    # 检查文件是否为图片
+    # 处理图片（是否为有效图片由处理函数打开时判断）
+    return RESIZE_ENGINES[engine](image_path, bak_dir, quality)
+
+def warm_up_worker():
+    """
+    进程池初始化函数：编码并解码一张很小的JPEG，提前加载 Pillow 的编解码器
+    """
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(buffer, 'JPEG')
+    buffer.seek(0)
+    with Image.open(buffer) as img:
+        img.load()
+
+def iter_image_files(dir_path: str, extensions: FrozenSet[str] = IMAGE_EXTENSIONS) -> Iterator[str]:
+    """
+    递归遍历目录，返回扩展名匹配的图片文件路径
+    
+    scandir 的 DirEntry 自带文件类型信息，不需要逐个 stat，也不需要再拼接路径
+    
+    Args:
+        dir_path: 目录路径
+        extensions: 支持的图片扩展名集合（小写，含点号）
+        
+    Returns:
+        Iterator[str]: 图片文件路径
+    """
+    # 和 os.walk 一样，无法读取的目录只记录警告并跳过，不中断整个处理过程
+    subdirs = []
     try:
-        with Image.open(image_path) as img:
-            pass
-    except Exception:
-        logger.error(f"文件 {image_path} 不是有效的图片")
-        return False
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                # 不进入符号链接目录，避免循环；符号链接的图片文件仍然处理
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    # 只把扩展名部分转成小写再查集合，不复制整个文件名
+                    name = entry.name
+                    dot = name.rfind('.')
+                    if dot >= 0 and name[dot:].lower() in extensions:
+                        yield entry.path
+    except OSError as e:
+        logger.warning("无法读取目录 %s，已跳过: %s", dir_path, e)
     
-    # 处理图片
-    return resize_and_crop_image(image_path, bak_dir)
+    # 当前目录的句柄关闭后再进入子目录，深层目录不会占用大量文件描述符
+    for subdir in subdirs:
+        yield from iter_image_files(subdir, extensions)
 
-def process_directory(dir_path: str, bak_dir: str = "bak") -> Tuple[int, int]:
+def process_directory(
+    dir_path: str,
+    bak_dir: str = "bak",
+    quality: int = DEFAULT_QUALITY,
+    use_threads: bool = False,
+    engine: str = "pillow"
+) -> Tuple[int, int]:
     """
     处理目录中的所有图片
     
     Args:
         dir_path: 目录路径
         bak_dir: 备份目录路径，默认为"bak"
+        quality: 保存质量 (1-100)，默认为95
+        use_threads: 使用线程池代替进程池；Pillow 在重采样和编码时会释放 GIL，
+            小图片较多时可省去进程启动和进程间通信的开销
+        engine: 处理引擎，见 RESIZE_ENGINES，默认为"pillow"
         
     Returns:
         Tuple[int, int]: (成功处理的图片数量, 处理失败的图片数量)
@@ -171,20 +403,28 @@ def process_directory(dir_path: str, bak_dir: str = "bak") -> Tuple[int, int]:
         logger.error(f"{dir_path} 不是有效的目录")
         return 0, 0
     
-    success_count = 0
-    fail_count = 0
+    image_paths = list(iter_image_files(dir_path))
+    if not image_paths:
+        return 0, 0
     
-    # 支持的图片扩展名
-    image_extensions = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff')
+    # 每张图片相互独立，重采样是CPU密集型操作，默认用多进程并行处理；进程间只传递路径
+    max_workers = min(os.cpu_count() or 1, len(image_paths))
+    if use_threads:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    else:
+        # 子进程启动时先完成编解码器初始化，不计入第一张图片的处理时间
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=warm_up_worker)
+    # 每个进程大约分到4批任务，兼顾进程间通信次数和负载均衡
+    chunksize = max(1, len(image_paths) // (4 * max_workers))
+    with executor:
+        results = list(executor.map(
+            partial(process_image, bak_dir=bak_dir, quality=quality, engine=engine),
+            image_paths,
+            chunksize=chunksize
+        ))
     
-    for root, _, files in os.walk(dir_path):
-        for file in files:
-            if file.lower().endswith(image_extensions):
-                image_path = os.path.join(root, file)
-                if process_image(image_path, bak_dir):
-                    success_count += 1
-                else:
-                    fail_count += 1
+    success_count = sum(results)
+    fail_count = len(results) - success_count
     
     return success_count, fail_count
 
@@ -195,16 +435,31 @@ def main():
     parser = argparse.ArgumentParser(description='调整图片尺寸为1280x720')
     parser.add_argument('path', help='图片路径或包含图片的目录路径')
     parser.add_argument('--bak', default='bak', help='备份目录路径，默认为"bak"')
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY,
+                        help=f'保存质量 (1-100)，默认为{DEFAULT_QUALITY}；降低到90左右可明显加快编码并减小文件')
+    parser.add_argument('--threads', action='store_true',
+                        help='处理目录时使用线程池代替进程池，适合大量小图片')
+    parser.add_argument('--engine', choices=sorted(RESIZE_ENGINES), default='pillow',
+                        help='处理引擎，默认为 pillow；vips 需要安装 pyvips，处理大图片时更快且占用内存更少；'
+                             'scipy 需要安装 numpy 和 scipy，使用三次样条插值')
     
     args = parser.parse_args()
     
+    if args.engine == 'vips' and importlib.util.find_spec('pyvips') is None:
+        parser.error('使用 vips 引擎需要先安装 pyvips: pip install pyvips')
+    if args.engine == 'scipy' and importlib.util.find_spec('scipy') is None:
+        parser.error('使用 scipy 引擎需要先安装 scipy: pip install scipy')
+    
     if os.path.isdir(args.path):
-        # 处理目录
-        success, fail = process_directory(args.path, args.bak)
-        logger.info(f"处理完成: {success} 个图片处理成功，{fail} 个图片处理失败")
+        # 处理目录，逐张图片的日志为 DEBUG 级别，这里只输出汇总
+        start_time = time.perf_counter()
+        success, fail = process_directory(args.path, args.bak, args.quality, args.threads, args.engine)
+        elapsed = time.perf_counter() - start_time
+        logger.info("处理完成: 共 %d 个图片，%d 个处理成功，%d 个处理失败，耗时 %.2f 秒",
+                    success + fail, success, fail, elapsed)
     else:
         # 处理单个图片
-        if process_image(args.path, args.bak):
+        if process_image(args.path, args.bak, args.quality, args.engine):
             logger.info("图片处理成功")
         else:
             logger.error("图片处理失败")
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+import resize_images
+from resize_images import TARGET_HEIGHT, TARGET_WIDTH, iter_image_files, resize_and_crop_image
+
+
+@pytest.mark.parametrize("mode", ["RGB", "P"])
+def test_integer_multiple_source_is_resized(tmp_path, mode):
+    image_path = tmp_path / "source.png"
+    Image.new(mode, (TARGET_WIDTH * 2, TARGET_HEIGHT * 2)).save(image_path)
+
+    assert resize_and_crop_image(str(image_path), str(tmp_path / "bak"))
+
+    with Image.open(image_path) as result:
+        assert result.size == (TARGET_WIDTH, TARGET_HEIGHT)
+    assert (tmp_path / "bak" / "source.png").exists()
+
+
+
+def test_iter_image_files_skips_unreadable_dirs_and_keeps_file_symlinks(tmp_path, monkeypatch):
+    (tmp_path / "photos").mkdir()
+    (tmp_path / "photos" / "a.jpg").touch()
+    (tmp_path / "other.png").touch()
+    (tmp_path / "photos" / "link.png").symlink_to(tmp_path / "other.png")
+    (tmp_path / "locked").mkdir()
+    (tmp_path / "locked" / "b.jpg").touch()
+
+    scandir = os.scandir
+
+    def guarded_scandir(path):
+        if os.path.basename(path) == "locked":
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    monkeypatch.setattr(resize_images.os, "scandir", guarded_scandir)
+
+    found = sorted(os.path.relpath(path, tmp_path) for path in iter_image_files(str(tmp_path)))
+    assert found == ["other.png", os.path.join("photos", "a.jpg"), os.path.join("photos", "link.png")]
@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip("boto3")
+
+from botocore.exceptions import ClientError
+
+from backend import video_generator
+from backend.video_generator import VideoGenerator
+
+THROTTLED = ClientError(
+    {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+    "GetAsyncInvoke"
+)
+
+
+class StubBedrockClient:
+    """Plays back get_async_invoke responses in order; exceptions are raised"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get_async_invoke(self, invocationArn):
+        self.calls += 1
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(video_generator.time, "sleep", calls.append)
+    return calls
+
+
+def make_generator(tmp_path, responses):
+    """Build a generator with one started job whose status checks hit the stub"""
+    generator = VideoGenerator(output_dir=str(tmp_path))
+    generator.aws_client.bedrock_client = StubBedrockClient(responses)
+    generator._update_job("session", job_id="arn:job", status="started")
+    return generator
+
+
+def test_wait_retries_transient_throttle(tmp_path, sleeps):
+    generator = make_generator(tmp_path, [
+        {"status": "InProgress"},
+        THROTTLED,
+        {"status": "Failed", "failureMessage": "bad prompt"},
+    ])
+
+    result = generator.wait_for_async_video("session")
+
+    assert result["status"] == "failed"
+    assert generator.aws_client.bedrock_client.calls == 3
+
+
+def test_wait_gives_up_after_repeated_throttles(tmp_path, sleeps):
+    generator = make_generator(tmp_path, [THROTTLED])
+
+    result = generator.wait_for_async_video("session", max_check_errors=3)
+
+    assert result["status"] == "unknown"
+    assert generator.aws_client.bedrock_client.calls == 3
+
+
+def test_wait_returns_missing_session_immediately(tmp_path, sleeps):
+    generator = make_generator(tmp_path, [THROTTLED])
+
+    result = generator.wait_for_async_video("missing")
+
+    assert result["status"] == "error"
+    assert generator.aws_client.bedrock_client.calls == 0
+    assert sleeps == []